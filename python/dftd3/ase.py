@@ -24,7 +24,9 @@ This module provides a basic single point calculator implementations
 to integrate the ``s-dftd3`` API into existing ASE workflows.
 To use DFTD3 as dispersion correction the ``ase.calculators.mixing``
 module can be used to combine DFTD3 with a DFT calculator using
-the ``SumCalculator``.
+the ``SumCalculator``. Alternatively, the ``FusedDFTD3Calculator`` adds
+the dispersion correction directly to the results of the DFT calculator,
+but does not provide the individual contributions of both calculators.
 
 Supported properties by this calculator are:
 
@@ -41,8 +43,13 @@ Supported keywords are
  damping                  None         Damping function to use
  params_tweaks            None         Optional dict with the damping parameters
  cache_api                True         Reuse generate API objects (recommended)
+ share_api                False        Share API objects between calculators
 ======================== ============ ============================================
 
+With share_api enabled, dispersion models are shared between all calculators
+in the process for systems with the same atomic numbers and periodicity.
+Evaluations of calculators sharing the same dispersion model are serialized.
+
 The params_tweaks dict contains the damping parameters, at least s8, a1 and a2
 must be provided
 
@@ -86,7 +93,13 @@ try:
 except ModuleNotFoundError:
     raise ModuleNotFoundError("This submodule requires ASE installed")
 
-from typing import List, Optional
+from collections import OrderedDict
+from contextlib import nullcontext
+from threading import Lock
+from typing import List, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+import numpy as np
 
 from .interface import (
     DispersionModel,
@@ -105,6 +118,7 @@ from ase.calculators.calculator import (
 )
 from ase.calculators.mixing import SumCalculator
 from ase.atoms import Atoms
+from ase.stress import full_3x3_to_voigt_6_stress
 from ase.units import Hartree, Bohr
 
 
@@ -118,6 +132,47 @@ _damping_param = {
     "d3op": OptimizedPowerDampingParam,
 }
 
+_inv_bohr = 1.0 / Bohr
+_force_scale = Hartree / Bohr
+_voigt_index = np.array([0, 4, 8, 5, 2, 1], dtype=np.intp)
+
+_damping_keys = ("method", "damping", "params_tweaks")
+_geometry_changes = frozenset(("positions", "cell"))
+
+_disp_cache: "OrderedDict[tuple, Tuple[DispersionModel, Lock]]" = OrderedDict()
+_disp_cache_size = 32
+# Guards lookup, insertion and eviction of shared dispersion models
+_disp_cache_lock = Lock()
+# Token of the calculator which last updated the geometry of a shared dispersion model
+_disp_owner: "WeakKeyDictionary[DispersionModel, object]" = WeakKeyDictionary()
+
+
+def _get_dispersion_model(
+    numbers: np.ndarray,
+    positions: np.ndarray,
+    lattice: np.ndarray,
+    periodic: np.ndarray,
+) -> Tuple[DispersionModel, Lock]:
+    """
+    Obtain a dispersion model from the process-wide cache or create a new one.
+    Models are shared between calculators for systems with the same atomic numbers
+    and periodicity. The geometry of a shared model must only be updated and
+    evaluated while holding the lock returned together with the model.
+    """
+
+    key = (numbers.tobytes(), periodic.tobytes())
+    with _disp_cache_lock:
+        entry = _disp_cache.get(key)
+        if entry is None:
+            entry = (DispersionModel(numbers, positions, lattice, periodic), Lock())
+            _disp_cache[key] = entry
+            if len(_disp_cache) > _disp_cache_size:
+                _disp_cache.popitem(last=False)
+        else:
+            _disp_cache.move_to_end(key)
+
+    return entry
+
 
 class DFTD3(Calculator):
     """
@@ -145,9 +200,16 @@ class DFTD3(Calculator):
         "damping": None,
         "params_tweaks": {},
         "cache_api": True,
+        "share_api": False,
     }
 
     _disp = None
+    _dpar = None
+    _damping_cls = None
+    _params_tweaks = None
+    _disp_lock = None
+    _pos_buf = None
+    _periodic = False
 
     def __init__(
         self,
@@ -156,6 +218,8 @@ class DFTD3(Calculator):
     ):
         """Construct the DFTD3 dispersion model object."""
 
+        # Identifies this calculator as last user of a shared dispersion model
+        self._api_token = object()
         Calculator.__init__(self, atoms=atoms, **kwargs)
 
     def add_calculator(self, other: Calculator) -> Calculator:
@@ -186,6 +250,21 @@ class DFTD3(Calculator):
         if changed_parameters:
             self.reset()
 
+        # Switching between shared and private dispersion models requires a new one
+        if "share_api" in changed_parameters:
+            self._disp = None
+
+        # Damping parameters only have to be recreated if their input changes
+        if any(key in changed_parameters for key in _damping_keys):
+            self._dpar = None
+            self._params_tweaks = (
+                self.parameters.params_tweaks
+                if self.parameters.params_tweaks
+                else {"method": self.parameters.method}
+            )
+        if "damping" in changed_parameters:
+            self._damping_cls = _damping_param.get(self.parameters.damping)
+
         return changed_parameters
 
     def reset(self) -> None:
@@ -194,33 +273,66 @@ class DFTD3(Calculator):
 
         if not self.parameters.cache_api:
             self._disp = None
+            self._dpar = None
 
     def _check_api_calculator(self, system_changes: List[str]) -> None:
         """Check state of API calculator and reset if necessary"""
 
+        if not system_changes:
+            return
+
         # Changes in positions and cell parameters can use a normal update
-        _reset = system_changes.copy()
-        if "positions" in _reset:
-            _reset.remove("positions")
-        if "cell" in _reset:
-            _reset.remove("cell")
+        _needs_reset = any(
+            change not in _geometry_changes for change in system_changes
+        )
 
         # Invalidate cached calculator and results object
-        if _reset:
+        if _needs_reset:
             self._disp = None
-        else:
-            if system_changes and self._disp is not None:
+        # Shared models are updated while holding their lock
+        elif not self.parameters.share_api:
+            # The lattice does not enter the dispersion for molecular systems
+            if system_changes == ["cell"] and not self._periodic:
+                return
+            if self._disp is not None:
                 try:
                     _cell = self.atoms.cell
                     self._disp.update(
-                        self.atoms.positions / Bohr,
-                        _cell / Bohr,
+                        self._get_api_positions(),
+                        _cell.array * _inv_bohr,
                     )
                 # An exception in this part means the geometry is bad,
                 # still we will give a complete reset a try as well
                 except RuntimeError:
                     self._disp = None
 
+    def _sync_shared_api_calculator(self, system_changes: List[str]) -> None:
+        """Update the geometry of a shared dispersion model while holding its lock"""
+
+        # The model might have been moved by another calculator since our last update
+        if not system_changes and _disp_owner.get(self._disp) is self._api_token:
+            return
+
+        # A failed update still overwrites the geometry of the model
+        _disp_owner.pop(self._disp, None)
+        try:
+            self._disp.update(
+                self._get_api_positions(),
+                self.atoms.cell.array * _inv_bohr,
+            )
+        except RuntimeError:
+            raise InputError("Cannot update dispersion model for dftd3")
+        _disp_owner[self._disp] = self._api_token
+
+    def _get_api_positions(self) -> np.ndarray:
+        """Convert positions to atomic units reusing a scratch buffer"""
+
+        _positions = self.atoms.positions
+        if self._pos_buf is None or self._pos_buf.shape != _positions.shape:
+            self._pos_buf = np.empty_like(_positions)
+
+        return np.multiply(_positions, _inv_bohr, out=self._pos_buf)
+
     def _create_api_calculator(self) -> DispersionModel:
         """Create a new API calculator object"""
 
@@ -228,12 +340,22 @@ class DFTD3(Calculator):
             _cell = self.atoms.cell
             _periodic = self.atoms.pbc
 
-            disp = DispersionModel(
-                self.atoms.numbers,
-                self.atoms.positions / Bohr,
-                _cell / Bohr,
-                _periodic,
-            )
+            if self.parameters.share_api:
+                disp, self._disp_lock = _get_dispersion_model(
+                    self.atoms.numbers,
+                    self._get_api_positions(),
+                    _cell.array * _inv_bohr,
+                    _periodic,
+                )
+            else:
+                disp = DispersionModel(
+                    self.atoms.numbers,
+                    self._get_api_positions(),
+                    _cell.array * _inv_bohr,
+                    _periodic,
+                )
+            # Changes in the periodicity always require a new dispersion model
+            self._periodic = bool(_periodic.any())
 
         except RuntimeError:
             raise InputError("Cannot construct dispersion model for dftd3")
@@ -243,9 +365,15 @@ class DFTD3(Calculator):
     def _create_damping_param(self) -> DampingParam:
         """Create a new API damping parameter object"""
 
+        if self._damping_cls is None:
+            raise InputError(
+                "Unknown damping function '{}' for dftd3".format(
+                    self.parameters.damping
+                )
+            )
+
         try:
-            params_tweaks = self.parameters.params_tweaks if self.parameters.params_tweaks else {"method": self.parameters.get("method")} 
-            dpar = _damping_param[self.parameters.get("damping")](**params_tweaks)
+            dpar = self._damping_cls(**self._params_tweaks)
 
         except RuntimeError:
             raise InputError("Cannot construct damping parameter for dftd3")
@@ -264,23 +392,178 @@ class DFTD3(Calculator):
             properties = ["energy"]
         Calculator.calculate(self, atoms, properties, system_changes)
 
+        if self._dpar is None:
+            self._dpar = self._create_damping_param()
+
         self._check_api_calculator(system_changes)
 
         if self._disp is None:
             self._disp = self._create_api_calculator()
 
-        _dpar = self._create_damping_param()
+        # Shared dispersion models must not be moved during the evaluation
+        with self._disp_lock if self.parameters.share_api else nullcontext():
+            if self.parameters.share_api:
+                self._sync_shared_api_calculator(system_changes)
 
-        try:
-            _res = self._disp.get_dispersion(param=_dpar, grad=True)
-        except RuntimeError:
-            raise CalculationFailed("dftd3 could not evaluate input")
+            try:
+                _res = self._disp.get_dispersion(param=self._dpar, grad=True)
+            except RuntimeError:
+                raise CalculationFailed("dftd3 could not evaluate input")
 
         # These properties are garanteed to exist for all implemented calculators
         self.results["energy"] = _res.get("energy") * Hartree
         self.results["free_energy"] = self.results["energy"]
-        self.results["forces"] = -_res.get("gradient") * Hartree / Bohr
+        self.results["forces"] = np.multiply(
+            _res["gradient"], -_force_scale, out=_res["gradient"]
+        )
         # stress tensor is only returned for periodic systems
-        if self.atoms.pbc.any():
-            _stress = _res.get("virial") * Hartree / self.atoms.get_volume()
-            self.results["stress"] = _stress.flat[[0, 4, 8, 5, 2, 1]]
+        if self._periodic:
+            self.results["stress"] = _res["virial"].ravel()[_voigt_index] * (
+                Hartree / self.atoms.get_volume()
+            )
+
+    def calculate_many(self, images: List[Atoms]) -> List[dict]:
+        """
+        Evaluate the dispersion correction for several structures at once,
+        like the images of a potential energy surface scan or a nudged elastic band.
+        All structures must share the same atomic numbers and periodicity, a single
+        dispersion model and damping parameter object is used for the whole batch.
+        The results for each image are returned as dictionary in ASE units.
+
+        Example
+        -------
+        >>> from ase.build import molecule
+        >>> from dftd3.ase import DFTD3
+        >>> atoms = molecule("H2O")
+        >>> images = [atoms.copy() for _ in range(3)]
+        >>> for image, scale in zip(images, (0.9, 1.0, 1.1)):
+        ...     image.positions *= scale
+        ...
+        >>> calc = DFTD3(method="PBE", damping="d3bj")
+        >>> [res["energy"] for res in calc.calculate_many(images)]
+        [-0.009787847025749093, -0.009781913226281063, -0.00981340981616578]
+        """
+
+        if not images:
+            return []
+
+        _numbers = images[0].numbers
+        _periodic = images[0].pbc
+        for atoms in images[1:]:
+            if not (
+                np.array_equal(atoms.numbers, _numbers)
+                and np.array_equal(atoms.pbc, _periodic)
+            ):
+                raise InputError(
+                    "All images must have the same atomic numbers and periodicity"
+                )
+
+        _positions = np.multiply(
+            np.stack([atoms.positions for atoms in images]), _inv_bohr
+        )
+        _cell = np.multiply(np.stack([atoms.cell.array for atoms in images]), _inv_bohr)
+
+        try:
+            disp = DispersionModel(_numbers, _positions[0], _cell[0], _periodic)
+        except RuntimeError:
+            raise InputError("Cannot construct dispersion model for dftd3")
+
+        if self._dpar is None:
+            self._dpar = self._create_damping_param()
+
+        try:
+            _res = disp.get_dispersion_batched(
+                param=self._dpar, positions=_positions, lattice=_cell, grad=True
+            )
+        except RuntimeError:
+            raise CalculationFailed("dftd3 could not evaluate input")
+
+        _energy = _res["energy"] * Hartree
+        _forces = np.multiply(_res["gradient"], -_force_scale, out=_res["gradient"])
+
+        results = []
+        for ibatch, atoms in enumerate(images):
+            res = {
+                "energy": _energy[ibatch],
+                "free_energy": _energy[ibatch],
+                "forces": _forces[ibatch],
+            }
+            # stress tensor is only returned for periodic systems
+            if _periodic.any():
+                res["stress"] = _res["virial"][ibatch].ravel()[_voigt_index] * (
+                    Hartree / atoms.get_volume()
+                )
+            results.append(res)
+
+        return results
+
+
+class FusedDFTD3Calculator(Calculator):
+    """
+    Combination of a DFTD3 dispersion correction with another calculator.
+    Equivalent to a SumCalculator of both calculators, but the dispersion correction
+    is evaluated first and added directly to the results of the other calculator.
+    The supported properties are the ones implemented by both calculators,
+    the individual contributions are only available from the combined calculators.
+
+    Example
+    -------
+    >>> from ase.build import molecule
+    >>> from ase.calculators.emt import EMT
+    >>> from dftd3.ase import DFTD3, FusedDFTD3Calculator
+    >>> atoms = molecule("H2O")
+    >>> atoms.calc = FusedDFTD3Calculator(DFTD3(method="PBE", damping="d3bj"), EMT())
+    """
+
+    def __init__(self, dftd3: DFTD3, calc: Calculator):
+        """Combine the DFTD3 dispersion correction with another calculator."""
+
+        self.calcs = [dftd3, calc]
+        self.implemented_properties = [
+            prop
+            for prop in dftd3.implemented_properties
+            if prop in calc.implemented_properties
+        ]
+        Calculator.__init__(self)
+
+    def calculate(
+        self,
+        atoms: Optional[Atoms] = None,
+        properties: List[str] = None,
+        system_changes: List[str] = all_changes,
+    ) -> None:
+        """Evaluate the dispersion correction and the other calculator"""
+
+        if not properties:
+            properties = ["energy"]
+        Calculator.calculate(self, atoms, properties, system_changes)
+
+        for prop in properties:
+            self.results[prop] = self._get_fused_property(prop)
+
+        # Also store all properties which are already available from both calculators
+        for prop in self.implemented_properties:
+            if prop not in self.results and all(
+                prop in calc.results for calc in self.calcs
+            ):
+                self.results[prop] = self._get_fused_property(prop)
+
+    def _get_fused_property(self, name: str):
+        """Sum a property of both calculators"""
+
+        _disp = self.calcs[0].get_property(name, self.atoms)
+        value = self.calcs[1].get_property(name, self.atoms)
+        # Stress tensors might be returned in full 3x3 form instead of Voigt form
+        if name == "stress":
+            if _disp.shape == (3, 3):
+                _disp = full_3x3_to_voigt_6_stress(_disp)
+            if value.shape == (3, 3):
+                value = full_3x3_to_voigt_6_stress(value)
+        # Arrays are returned as copies by the calculators and can be updated in place
+        if isinstance(value, np.ndarray):
+            return np.add(value, _disp, out=value)
+        return value + _disp
+
+    def __str__(self) -> str:
+        calculators = ", ".join(calc.__class__.__name__ for calc in self.calcs)
+        return "{}({})".format(self.__class__.__name__, calculators)
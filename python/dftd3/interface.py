@@ -439,6 +439,72 @@ class DispersionModel(Structure):
             results.update(virial=_sigma)
         return results
 
+    def get_dispersion_batched(
+        self,
+        param: DampingParam,
+        positions: np.ndarray,
+        lattice: Optional[np.ndarray] = None,
+        grad: bool = False,
+    ) -> dict:
+        """
+        Evaluate the dispersion correction for a batch of geometries of the same system.
+        The positions are provided as (nbatch, natoms, 3) array and the optional
+        lattices as (nbatch, 3, 3) array, both in atomic units (Bohr).
+        The results are stacked along the first dimension, the model retains the
+        last geometry of the batch afterwards.
+
+        Raises
+        ------
+        ValueError
+            on invalid input, like incorrect shape / type of the passed arrays
+        """
+
+        if positions.size % (3 * len(self)) != 0:
+            raise ValueError("Dimension missmatch for positions")
+        _nbatch = positions.size // (3 * len(self))
+        _positions = np.ascontiguousarray(positions, dtype="float").reshape(
+            _nbatch, len(self), 3
+        )
+
+        if lattice is not None:
+            if lattice.size != 9 * _nbatch:
+                raise ValueError("Invalid lattice provided")
+            _lattice = np.ascontiguousarray(lattice, dtype="float").reshape(
+                _nbatch, 3, 3
+            )
+        else:
+            _lattice = None
+
+        _energy = np.zeros(_nbatch)
+        if grad:
+            _gradient = np.zeros((_nbatch, len(self), 3))
+            _sigma = np.zeros((_nbatch, 3, 3))
+        else:
+            _gradient = None
+            _sigma = None
+
+        for ibatch in range(_nbatch):
+            library.update_structure(
+                self._mol,
+                _cast("double*", _positions[ibatch]),
+                _cast("double*", None if _lattice is None else _lattice[ibatch]),
+            )
+            library.get_dispersion(
+                self._mol,
+                self._disp,
+                param._param,
+                _cast("double*", _energy[ibatch : ibatch + 1]),
+                _cast("double*", None if _gradient is None else _gradient[ibatch]),
+                _cast("double*", None if _sigma is None else _sigma[ibatch]),
+            )
+
+        results = dict(energy=_energy)
+        if _gradient is not None:
+            results.update(gradient=_gradient)
+        if _sigma is not None:
+            results.update(virial=_sigma)
+        return results
+
     def get_pairwise_dispersion(self, param: DampingParam) -> dict:
         """Evaluate pairwise representation of the dispersion energy"""
 
@@ -14,6 +14,7 @@
 # You should have received a copy of the Lesser GNU General Public License
 # along with s-dftd3.  If not, see <https://www.gnu.org/licenses/>.
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterator
 
 import numpy as np
@@ -22,8 +23,10 @@ from pytest import approx, raises
 
 try:
     import ase
-    from dftd3.ase import DFTD3
-    from ase.build import molecule
+    import dftd3.ase
+    from dftd3.ase import DFTD3, FusedDFTD3Calculator
+    from ase.build import bulk, molecule
+    from ase.calculators.calculator import Calculator, all_changes
     from ase.calculators.emt import EMT
 except ModuleNotFoundError:
     ase = None
@@ -97,3 +100,254 @@ def test_ase_tpssd4():
     assert atoms.get_potential_energy() == approx(4.963774668847532, abs=thr)
     energies = [calc.get_potential_energy() for calc in get_calcs(atoms.calc)]
     assert energies == approx([-0.14230914516094673, 5.106083814008478], abs=thr)
+
+
+@pytest.mark.skipif(ase is None, reason="requires ase")
+def test_ase_set_method():
+    thr = 1.0e-6
+
+    atoms = molecule("H2O")
+    atoms.calc = DFTD3(method="TPSS", damping="d3bj")
+    assert atoms.get_potential_energy() == approx(-0.0114416338147162, abs=thr)
+
+    atoms.calc.set(method="PBE")
+    assert atoms.get_potential_energy() == approx(-0.009781913226281063, abs=thr)
+
+    atoms.calc.set(params_tweaks={"s8": 0.7875, "a1": 0.4289, "a2": 4.4407})
+    assert atoms.get_potential_energy() == approx(-0.009781913226281063, abs=thr)
+
+
+@pytest.mark.skipif(ase is None, reason="requires ase")
+def test_ase_molecule_cell():
+    thr = 1.0e-6
+
+    atoms = molecule("H2O")
+    atoms.calc = DFTD3(method="PBE", damping="d3bj")
+    energy = atoms.get_potential_energy()
+
+    atoms.set_cell([10.0, 10.0, 10.0])
+    assert atoms.get_potential_energy() == approx(energy, abs=thr)
+
+    atoms.positions[0, 2] += 0.1
+    assert atoms.get_potential_energy() != approx(energy, abs=thr)
+
+
+@pytest.mark.skipif(ase is None, reason="requires ase")
+def test_ase_pbed3_bulk():
+    thr = 1.0e-7
+
+    forces = np.array(
+        [
+            [+2.32788200e-03, -4.60196900e-03, +9.50542990e-03],
+            [+6.19259330e-03, -1.47057370e-03, -5.81039560e-03],
+            [+2.43383080e-02, +1.83691307e-02, -9.99035850e-03],
+            [+1.35471700e-04, +3.06208000e-04, -5.54616680e-03],
+            [-6.95959810e-03, -9.55950530e-03, -1.08157291e-02],
+            [-1.24378912e-02, -1.29672139e-02, +1.64711869e-02],
+            [-5.94143370e-03, +1.57247500e-03, +1.20945947e-02],
+            [-7.65533200e-03, +8.35144830e-03, -5.90856140e-03],
+        ]
+    )
+    stress = np.array(
+        [
+            +1.37494195e-02,
+            +1.37670852e-02,
+            +1.37455332e-02,
+            +1.03791892e-04,
+            +7.68460483e-05,
+            -5.08276777e-05,
+        ]
+    )
+
+    atoms = bulk("Si", "diamond", a=5.43, cubic=True)
+    atoms.rattle(0.05, seed=42)
+    atoms.calc = DFTD3(method="PBE", damping="d3bj")
+
+    assert atoms.get_potential_energy() == approx(-2.4128007187212037, abs=thr)
+    assert atoms.get_forces() == approx(forces, abs=thr)
+    assert atoms.get_stress() == approx(stress, abs=thr)
+
+
+@pytest.mark.skipif(ase is None, reason="requires ase")
+def test_ase_calculate_many():
+    thr = 1.0e-8
+
+    atoms = bulk("Si", "diamond", a=5.43, cubic=True)
+    images = []
+    for seed in range(4):
+        image = atoms.copy()
+        image.rattle(0.05, seed=seed)
+        images.append(image)
+
+    calc = DFTD3(method="PBE", damping="d3bj")
+    results = calc.calculate_many(images)
+    assert len(results) == len(images)
+
+    for image, res in zip(images, results):
+        image.calc = DFTD3(method="PBE", damping="d3bj")
+        assert res["energy"] == approx(image.get_potential_energy(), abs=thr)
+        assert res["forces"] == approx(image.get_forces(), abs=thr)
+        assert res["stress"] == approx(image.get_stress(), abs=thr)
+
+    with raises(ase.calculators.calculator.InputError):
+        calc.calculate_many([atoms, molecule("H2O")])
+
+
+@pytest.mark.skipif(ase is None, reason="requires ase")
+def test_ase_unknown_damping():
+    atoms = molecule("H2O")
+
+    atoms.calc = DFTD3(method="PBE", damping="d4")
+    with raises(ase.calculators.calculator.InputError, match="d4"):
+        atoms.get_potential_energy()
+
+    atoms.calc.set(damping="d3zero")
+    assert atoms.get_potential_energy() < 0.0
+
+
+@pytest.mark.skipif(ase is None, reason="requires ase")
+def test_ase_toggle_pbc():
+    atoms = molecule("H2O")
+    atoms.set_cell([8.0, 8.0, 8.0])
+    atoms.calc = DFTD3(method="PBE", damping="d3bj")
+
+    with raises(ase.calculators.calculator.PropertyNotImplementedError):
+        atoms.get_stress()
+
+    atoms.pbc = True
+    assert atoms.get_stress().shape == (6,)
+
+    atoms.pbc = False
+    with raises(ase.calculators.calculator.PropertyNotImplementedError):
+        atoms.get_stress()
+
+
+@pytest.mark.skipif(ase is None, reason="requires ase")
+def test_ase_shared_model():
+    thr = 1.0e-8
+
+    atoms1 = molecule("H2O")
+    atoms1.calc = DFTD3(method="PBE", damping="d3bj", share_api=True)
+    energy1 = atoms1.get_potential_energy()
+
+    atoms2 = molecule("H2O")
+    atoms2.positions *= 1.1
+    atoms2.calc = DFTD3(method="PBE", damping="d3bj", share_api=True)
+    energy2 = atoms2.get_potential_energy()
+    assert atoms2.calc._disp is atoms1.calc._disp
+
+    # Recalculation without system changes must not use the moved geometry
+    atoms1.calc.calculate(atoms1, ["energy"], [])
+    assert atoms1.calc.results["energy"] == approx(energy1, abs=thr)
+
+    atoms1.set_cell([10.0, 10.0, 10.0])
+    assert atoms1.get_potential_energy() == approx(energy1, abs=thr)
+
+    atoms2.calc.calculate(atoms2, ["energy"], [])
+    assert atoms2.calc.results["energy"] == approx(energy2, abs=thr)
+
+    # A failed update still moves the shared model
+    atoms1.calc.calculate(atoms1, ["energy"], [])
+    atoms2.positions[:, :] = 0.0
+    with raises(ase.calculators.calculator.InputError):
+        atoms2.get_potential_energy()
+    atoms1.calc.calculate(atoms1, ["energy"], [])
+    assert atoms1.calc.results["energy"] == approx(energy1, abs=thr)
+
+    atoms3 = molecule("H2O")
+    atoms3.calc = DFTD3(method="PBE", damping="d3bj")
+    assert atoms3.get_potential_energy() == approx(energy1, abs=thr)
+    assert atoms3.calc._disp is not atoms1.calc._disp
+    # Private dispersion models are not tracked for sharing
+    assert atoms3.calc._disp not in dftd3.ase._disp_owner
+
+    # Unrelated systems do not share a model nor its lock
+    atoms4 = molecule("CH4")
+    atoms4.calc = DFTD3(method="PBE", damping="d3bj", share_api=True)
+    atoms4.get_potential_energy()
+    assert atoms4.calc._disp is not atoms1.calc._disp
+    assert atoms4.calc._disp_lock is not atoms1.calc._disp_lock
+
+
+@pytest.mark.skipif(ase is None, reason="requires ase")
+@pytest.mark.parametrize("share_api", [False, True])
+def test_ase_threaded(share_api):
+    thr = 1.0e-8
+
+    images = []
+    for scale in (0.95, 1.0, 1.05, 1.1):
+        atoms = molecule("C60")
+        atoms.positions *= scale
+        images.append(atoms)
+
+    reference = []
+    for atoms in images:
+        calc = DFTD3(method="PBE", damping="d3bj", cache_api=False)
+        reference.append(calc.get_potential_energy(atoms))
+
+    def evaluate(atoms):
+        calc = DFTD3(method="PBE", damping="d3bj", share_api=share_api)
+        energies = []
+        for _ in range(20):
+            calc.calculate(atoms, ["energy"], ["positions"])
+            energies.append(calc.results["energy"])
+        return energies
+
+    with ThreadPoolExecutor(max_workers=len(images)) as executor:
+        results = list(executor.map(evaluate, images))
+
+    for energies, ref in zip(results, reference):
+        assert energies == approx([ref] * len(energies), abs=thr)
+
+
+@pytest.mark.skipif(ase is None, reason="requires ase")
+def test_ase_fused_calculator():
+    thr = 1.0e-8
+
+    atoms = bulk("Cu", "fcc", a=3.6, cubic=True)
+    atoms.rattle(0.05, seed=42)
+
+    d3 = DFTD3(method="PBE", damping="d3bj")
+    atoms.calc = FusedDFTD3Calculator(d3, EMT())
+    assert str(atoms.calc) == "FusedDFTD3Calculator(DFTD3, EMT)"
+
+    energy = atoms.get_potential_energy()
+    forces = atoms.get_forces()
+    stress = atoms.get_stress()
+
+    dftd3, emt = get_calcs(atoms.calc)
+    assert dftd3 is d3
+    assert energy == approx(
+        dftd3.get_potential_energy(atoms) + emt.get_potential_energy(atoms), abs=thr
+    )
+    assert forces == approx(dftd3.get_forces(atoms) + emt.get_forces(atoms), abs=thr)
+    assert stress == approx(dftd3.get_stress(atoms) + emt.get_stress(atoms), abs=thr)
+
+    atoms.positions[0, 0] += 0.1
+    assert atoms.get_potential_energy() != approx(energy, abs=thr)
+
+
+@pytest.mark.skipif(ase is None, reason="requires ase")
+def test_ase_fused_calculator_full_stress():
+    thr = 1.0e-8
+
+    class FullStress(Calculator):
+        implemented_properties = ["energy", "forces", "stress"]
+
+        def calculate(self, atoms=None, properties=None, system_changes=all_changes):
+            Calculator.calculate(self, atoms, properties, system_changes)
+            self.results["energy"] = 1.0
+            self.results["forces"] = np.zeros((len(self.atoms), 3))
+            self.results["stress"] = np.array(
+                [[1.0, 0.6, 0.5], [0.6, 2.0, 0.4], [0.5, 0.4, 3.0]]
+            )
+
+    atoms = bulk("Si", "diamond", a=5.43, cubic=True)
+    atoms.rattle(0.05, seed=42)
+    atoms.calc = FusedDFTD3Calculator(DFTD3(method="PBE", damping="d3bj"), FullStress())
+
+    assert atoms.get_potential_energy() == approx(1.0 - 2.4128007187212037, abs=thr)
+
+    dftd3 = DFTD3(method="PBE", damping="d3bj")
+    stress = dftd3.get_stress(atoms) + np.array([1.0, 2.0, 3.0, 0.4, 0.5, 0.6])
+    assert atoms.get_stress() == approx(stress, abs=thr)
@@ -327,6 +327,43 @@ def test_bp_d3_op(atm):
     assert approx(res.get("energy")) == ref
 
 
+def test_dispersion_batched():
+    """Evaluate several geometries of the same molecule at once"""
+    thr = 1.0e-10
+
+    numbers = np.array([8, 1, 1])
+    positions = np.array(
+        [
+            [+0.00000000000000, +0.00000000000000, -0.73578586109551],
+            [+1.44183152868459, +0.00000000000000, +0.36789293054775],
+            [-1.44183152868459, +0.00000000000000, +0.36789293054775],
+        ]
+    )
+    batch = np.array([positions * scale for scale in (0.9, 1.0, 1.1, 1.2)])
+    param = RationalDampingParam(method="pbe")
+
+    model = DispersionModel(numbers, positions)
+    res = model.get_dispersion_batched(param, batch, grad=True)
+    assert res["energy"].shape == (4,)
+    assert res["gradient"].shape == (4, 3, 3)
+    assert res["virial"].shape == (4, 3, 3)
+
+    for ibatch, xyz in enumerate(batch):
+        ref = DispersionModel(numbers, xyz).get_dispersion(param, grad=True)
+        assert res["energy"][ibatch] == approx(ref["energy"], abs=thr)
+        assert res["gradient"][ibatch] == approx(ref["gradient"], abs=thr)
+        assert res["virial"][ibatch] == approx(ref["virial"], abs=thr)
+
+    res = model.get_dispersion_batched(param, batch, grad=False)
+    assert "gradient" not in res
+
+    with raises(ValueError, match="Dimension missmatch"):
+        model.get_dispersion_batched(param, np.zeros((4, 2, 3)))
+
+    with raises(ValueError, match="Invalid lattice"):
+        model.get_dispersion_batched(param, batch, np.zeros((3, 3, 3)))
+
+
 def test_pair_resolved():
     """Calculate pairwise resolved dispersion energy for a molecule"""
     thr = 1.0e-8